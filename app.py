@@ -1,8 +1,16 @@
 import json
+import math
+import pickle
 import random
+import sys
+import threading
+import time
 from pathlib import Path
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
+import numpy as np
+import orjson
 import streamlit as st
 
 # -----------------------
@@ -12,16 +20,18 @@ APP_TITLE = "General Knowledge Trainer"
 
 # NOTE: You said your folders are capitalized as Data/Banks
 BANKS_DIR = Path("Data/Banks")
+STATS_PATH = Path("Data/stats.json")
 
 WEAK_THRESHOLD = 0.7
 WEAK_MAX_TOPICS = 3
 DEFAULT_DAILY_PRACTICE_N = 8
+# Below this many topics the weak-topic pick is a few microseconds in plain
+# Python, less than numba's one-off compile costs back
+JIT_MIN_TOPICS = 500
 
 DIFFICULTIES = ["easy", "medium", "hard"]
 REQUIRED_KEYS = {"id", "topic", "difficulty", "question", "options", "answer", "explanation"}
 
-random.seed()
-
 st.set_page_config(page_title=APP_TITLE, page_icon="🧠", layout="centered")
 st.title("🧠 General Knowledge Trainer")
 st.write(
@@ -32,6 +42,102 @@ st.write(
 # -----------------------
 # DATA LOADING (JSONL BANKS)
 # -----------------------
+# Bump when the cached per-file parse results change shape, to invalidate old sidecars
+BANK_CACHE_FORMAT = 9
+
+def _bank_cache_path(banks_dir: Path) -> Path:
+    return banks_dir / ".cache" / "banks.pkl"
+
+def _load_bank_cache(cache_path: Path):
+    """
+    Per-file parse results from the sidecar: {file name: ((mtime_ns, size), records, errors)}.
+    """
+    try:
+        with cache_path.open("rb") as f:
+            cache = pickle.load(f)
+    except Exception:
+        return {}  # missing or unreadable sidecar: every bank gets parsed
+    if not isinstance(cache, dict) or cache.get("format") != BANK_CACHE_FORMAT:
+        return {}
+    return cache["files"]
+
+def _write_bank_cache(cache_path: Path, files: dict):
+    """
+    Save the per-file parse results next to the sources.
+    """
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump({"format": BANK_CACHE_FORMAT, "files": files}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(cache_path)
+    except OSError:
+        pass  # the sidecar is only an optimization
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _parse_bank_file(fpath: Path):
+    """
+    Parse and validate one bank file.
+    Returns ([(lineno, question), ...], [(lineno, error), ...]); ids are checked across files by the caller.
+    """
+    records = []
+    errors = []
+
+    # Binary mode: orjson parses the raw UTF-8 bytes and ignores the trailing newline
+    with fpath.open("rb") as f:
+        for lineno, line in enumerate(f, start=1):
+            if line.isspace():
+                continue
+            try:
+                q = orjson.loads(line)
+            except Exception as e:
+                errors.append((lineno, f"{fpath.name}:{lineno} invalid JSON: {e}"))
+                continue
+
+            # Validate keys
+            if not all(k in q for k in REQUIRED_KEYS):
+                missing = REQUIRED_KEYS - q.keys()
+                errors.append((lineno, f"{fpath.name}:{lineno} missing keys: {sorted(missing)}"))
+                continue
+
+            # Validate difficulty
+            if q["difficulty"] not in DIFFICULTIES:
+                errors.append((
+                    lineno,
+                    f"{fpath.name}:{lineno} invalid difficulty '{q['difficulty']}'. "
+                    f"Must be one of {DIFFICULTIES}.",
+                ))
+                continue
+
+            # Validate options
+            if not isinstance(q["options"], list) or len(q["options"]) < 2:
+                errors.append((lineno, f"{fpath.name}:{lineno} options must be a list with >= 2 items."))
+                continue
+
+            # Validate options are distinct, so the answer matches exactly one of them
+            if any(opt in q["options"][:i] for i, opt in enumerate(q["options"])):
+                errors.append((lineno, f"{fpath.name}:{lineno} options must not repeat."))
+                continue
+
+            # Validate answer in options
+            if q["answer"] not in q["options"]:
+                errors.append((lineno, f"{fpath.name}:{lineno} answer must be one of the options."))
+                continue
+
+            q["answer_idx"] = q["options"].index(q["answer"])
+
+            # Topics, difficulties and option strings repeat a lot across a bank;
+            # interning makes every occurrence share one string object
+            q["topic"] = _intern(q["topic"])
+            q["difficulty"] = _intern(q["difficulty"])
+            q["options"] = tuple(map(_intern, q["options"]))
+            q["answer"] = q["options"][q["answer_idx"]]
+            records.append((lineno, q))
+
+    return records, errors
+
 @st.cache_data
 def load_banks_from_jsonl(banks_dir: Path):
     if not banks_dir.exists():
@@ -41,7 +147,7 @@ def load_banks_from_jsonl(banks_dir: Path):
         )
         st.stop()
 
-    bank_files = sorted(list(banks_dir.glob("*.jsonl")))
+    bank_files = sorted(banks_dir.glob("*.jsonl"))
     if not bank_files:
         st.error(
             f"No .jsonl files found in {banks_dir}.\n\n"
@@ -49,53 +155,54 @@ def load_banks_from_jsonl(banks_dir: Path):
         )
         st.stop()
 
+    # Each file's parse results are kept in a pickle sidecar keyed by its
+    # mtime/size, so only banks edited since the last load are re-parsed.
+    cache_path = _bank_cache_path(banks_dir)
+    cached = _load_bank_cache(cache_path)
+    files = {}
+    stale = []
+    for fpath in bank_files:
+        info = fpath.stat()
+        key = (info.st_mtime_ns, info.st_size)
+        entry = cached.get(fpath.name)
+        if entry is not None and entry[0] == key:
+            files[fpath.name] = entry
+        else:
+            stale.append((fpath, key))
+
+    if stale or len(files) != len(cached):
+        stale_paths = [fpath for fpath, _ in stale]
+        if len(stale_paths) > 1:
+            # Files are independent, so read and validate them concurrently
+            with ThreadPoolExecutor(max_workers=min(8, len(stale_paths))) as pool:
+                parsed = list(pool.map(_parse_bank_file, stale_paths))
+        else:
+            # Usually just the one edited bank (or none): no pool to spin up
+            parsed = [_parse_bank_file(fpath) for fpath in stale_paths]
+        for (fpath, key), (records, file_errors) in zip(stale, parsed):
+            files[fpath.name] = (key, records, file_errors)
+        _write_bank_cache(cache_path, files)
+
+    # The cross-file duplicate-id check runs on the merged results in file order
     all_questions = []
     ids_seen = set()
     errors = []
 
     for fpath in bank_files:
-        with fpath.open("r", encoding="utf-8") as f:
-            for lineno, line in enumerate(f, start=1):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    q = json.loads(line)
-                except Exception as e:
-                    errors.append(f"{fpath.name}:{lineno} invalid JSON: {e}")
-                    continue
-
-                # Validate keys
-                missing = REQUIRED_KEYS - set(q.keys())
-                if missing:
-                    errors.append(f"{fpath.name}:{lineno} missing keys: {sorted(missing)}")
-                    continue
-
-                # Validate difficulty
-                if q["difficulty"] not in DIFFICULTIES:
-                    errors.append(
-                        f"{fpath.name}:{lineno} invalid difficulty '{q['difficulty']}'. "
-                        f"Must be one of {DIFFICULTIES}."
-                    )
-                    continue
-
-                # Validate options
-                if not isinstance(q["options"], list) or len(q["options"]) < 2:
-                    errors.append(f"{fpath.name}:{lineno} options must be a list with >= 2 items.")
-                    continue
-
-                # Validate answer in options
-                if q["answer"] not in q["options"]:
-                    errors.append(f"{fpath.name}:{lineno} answer must be one of the options.")
-                    continue
-
-                # Validate unique id
-                if q["id"] in ids_seen:
-                    errors.append(f"{fpath.name}:{lineno} duplicate id '{q['id']}'.")
-                    continue
-
-                ids_seen.add(q["id"])
-                all_questions.append(q)
+        _, records, parse_errors = files[fpath.name]
+        file_errors = list(parse_errors)
+        for lineno, q in records:
+            # Validate unique id
+            if q["id"] in ids_seen:
+                file_errors.append((lineno, f"{fpath.name}:{lineno} duplicate id '{q['id']}'."))
+                continue
+
+            ids_seen.add(q["id"])
+            all_questions.append(q)
+
+        # Report each file's errors in line order, duplicate ids included
+        file_errors.sort(key=lambda err: err[0])
+        errors.extend(msg for _, msg in file_errors)
 
     if errors:
         st.error("❌ Question bank validation failed. Fix these issues and redeploy:")
@@ -105,114 +212,358 @@ def load_banks_from_jsonl(banks_dir: Path):
             st.write(f"... and {len(errors) - 50} more.")
         st.stop()
 
-    return all_questions
+    topics = tuple(sorted({q["topic"] for q in all_questions}))
+    topic_idx = {t: i for i, t in enumerate(topics)}
+    diff_idx = {d: i for i, d in enumerate(DIFFICULTIES)}
+
+    # Columnar topic/difficulty ids, so the indexes below come from
+    # vectorized numpy ops instead of per-record dict lookups
+    n = len(all_questions)
+    topic_col = np.fromiter((topic_idx[q["topic"]] for q in all_questions), dtype=np.int32, count=n)
+    diff_col = np.fromiter((diff_idx[q["difficulty"]] for q in all_questions), dtype=np.int8, count=n)
+
+    # Integer topic id per question, used to index the stats arrays
+    for q, tid in zip(all_questions, topic_col.tolist()):
+        q["_tid"] = tid
+
+    # One stable sort on (topic id, difficulty id) groups questions by topic,
+    # then by difficulty, so both indexes below are slices of `order`
+    bucket_key = topic_col.astype(np.int64) * len(DIFFICULTIES) + diff_col
+    order = np.argsort(bucket_key, kind="stable")
+
+    # Index questions by topic once so selection doesn't rescan the whole bank;
+    # every topic has at least one question, so each gets a non-empty slice
+    topic_starts = np.searchsorted(topic_col[order], np.arange(len(topics)))
+    index_by_topic = {
+        t: idx.tolist() for t, idx in zip(topics, np.split(order, topic_starts[1:]))
+    }
+
+    # Flat (topic id, difficulty id) -> tuple of question indices;
+    # plain tuples keep lookups single-level and pickle cheaply
+    keys, starts = np.unique(bucket_key[order], return_index=True)
+    buckets = {
+        divmod(key, len(DIFFICULTIES)): tuple(idx.tolist())
+        for key, idx in zip(keys.tolist(), np.split(order, starts[1:]))
+    }
+
+    # Topics missing a difficulty bucket; only these need the diagnostic top-up
+    needs_fallback = frozenset(
+        tid for tid in range(len(topics))
+        if any((tid, did) not in buckets for did in range(len(DIFFICULTIES)))
+    )
 
+    # Identifies this load of the banks; per-session state holding question
+    # indices is tagged with it and dropped once the banks are reloaded changed
+    bank_version = tuple((fpath.name, *files[fpath.name][0]) for fpath in bank_files)
 
-ALL_QUESTIONS = load_banks_from_jsonl(BANKS_DIR)
-TOPICS = sorted({q["topic"] for q in ALL_QUESTIONS})
+    return all_questions, index_by_topic, topics, buckets, needs_fallback, bank_version
 
-# Organize by topic/difficulty for sampling
-BY_TOPIC_DIFFICULTY = defaultdict(lambda: defaultdict(list))
-for q in ALL_QUESTIONS:
-    BY_TOPIC_DIFFICULTY[q["topic"]][q["difficulty"]].append(q)
+
+(
+    ALL_QUESTIONS, INDEX_BY_TOPIC, TOPICS, BUCKETS, TOPICS_NEEDING_FALLBACK, BANK_VERSION,
+) = load_banks_from_jsonl(BANKS_DIR)
+N_Q = len(ALL_QUESTIONS)
+TOPIC_IDX = {t: i for i, t in enumerate(TOPICS)}
+_ZERO_TOPIC_COUNTS = np.zeros(len(TOPICS), dtype=np.int32)
 
 # -----------------------
 # PERSONALIZATION
 # -----------------------
-def init_global_stats():
+def _zero_stats():
     return {
-        "topic_correct": {t: 0 for t in TOPICS},
-        "topic_total": {t: 0 for t in TOPICS},
+        "topic_correct": _ZERO_TOPIC_COUNTS.copy(),
+        "topic_total": _ZERO_TOPIC_COUNTS.copy(),
+        "total": 0,
     }
 
-def record_answer(topic: str, is_correct: bool):
-    st.session_state.global_stats["topic_total"][topic] += 1
-    if is_correct:
-        st.session_state.global_stats["topic_correct"][topic] += 1
+@st.cache_resource
+def _stats_store(topics: tuple):
+    """
+    Process-wide stats object, seeded from STATS_PATH so progress survives
+    server restarts. Looked up on every use rather than kept in session
+    state, so all sessions switch to a new store if the cache is cleared.
+    Keyed on the topic list so an edited bank gets a matching store.
+    """
+    stats = _zero_stats()
+    # Bumped on every stats change so derived values can be memoized across reruns;
+    # starts from the clock so a replacement store never reuses an old version
+    stats["version"] = time.time_ns()
+    # Sessions run on separate threads; updates and saves happen under this lock
+    stats["lock"] = threading.Lock()
+    try:
+        saved = json.loads(STATS_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        saved = {}
+    if not isinstance(saved, dict):
+        saved = {}
+    for key in ("topic_correct", "topic_total"):
+        counts = saved.get(key)
+        if not isinstance(counts, dict):
+            continue
+        for t, count in counts.items():
+            # Skip topics no longer in the banks and anything that isn't a count
+            if t in TOPIC_IDX and type(count) is int and 0 <= count < 2**31:
+                stats[key][TOPIC_IDX[t]] = count
+    stats["total"] = int(stats["topic_total"].sum())
+    return stats
+
+def save_global_stats(stats):
+    """
+    Write stats to STATS_PATH via a temp file, so a crash mid-write
+    never leaves a truncated file behind. Call with stats["lock"] held.
+    """
+    try:
+        tmp_path = STATS_PATH.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({
+                "topic_correct": dict(zip(TOPICS, stats["topic_correct"].tolist())),
+                "topic_total": dict(zip(TOPICS, stats["topic_total"].tolist())),
+            }),
+            encoding="utf-8",
+        )
+        tmp_path.replace(STATS_PATH)
+    except OSError:
+        pass  # persistence is best-effort; in-memory stats stay valid
+
+def init_global_stats():
+    """
+    Reset the shared stats store to zero and return it.
+    """
+    stats = _stats_store(TOPICS)
+    with stats["lock"]:
+        stats.update(_zero_stats())
+        stats["version"] += 1
+        save_global_stats(stats)
+    return stats
+
+def record_answer(topic_id: int, is_correct: bool):
+    stats = _stats_store(TOPICS)
+    with stats["lock"]:
+        stats["topic_total"][topic_id] += 1
+        stats["total"] += 1
+        if is_correct:
+            stats["topic_correct"][topic_id] += 1
+        stats["version"] += 1
+        save_global_stats(stats)
 
 def compute_accuracies(stats):
-    acc = {}
-    for t in TOPICS:
-        total = stats["topic_total"].get(t, 0)
-        correct = stats["topic_correct"].get(t, 0)
-        acc[t] = (correct / total) if total > 0 else 0.5
-    return acc
+    """
+    Per-topic accuracy as an array aligned with TOPICS (0.5 for untried topics).
+    """
+    version = stats["version"]
+    if st.session_state.get("_acc_version") != version:
+        total = stats["topic_total"]
+        correct = stats["topic_correct"]
+        st.session_state._acc = np.where(total > 0, correct / np.maximum(total, 1), 0.5)
+        st.session_state._acc_version = version
+    return st.session_state._acc
+
+def _weak_topic_ids(acc, threshold, k):
+    """
+    Ids of up to k topics with accuracy below threshold, weakest first
+    (ties keep TOPICS order). Written to compile under numba's nopython mode.
+    """
+    order = np.argsort(acc, kind="mergesort")
+    out = np.empty(min(k, order.size), np.int64)
+    m = 0
+    for i in order[:out.size]:
+        if acc[i] >= threshold:
+            break
+        out[m] = i
+        m += 1
+    return out[:m]
+
+@st.cache_resource
+def _weak_topic_kernel(use_jit: bool):
+    """
+    _weak_topic_ids JIT-compiled with numba when asked for and installed, else as is.
+    Cached so the script's rerun on every interaction doesn't recompile it.
+    No numba on-disk cache: loading it re-imports this script as a module.
+    """
+    if not use_jit:
+        return _weak_topic_ids
+    try:
+        from numba import njit
+    except ImportError:
+        return _weak_topic_ids
+    kernel = njit(_weak_topic_ids)
+    # Compile now, at load time, rather than inside the first page render
+    kernel(np.full(1, 0.5), WEAK_THRESHOLD, WEAK_MAX_TOPICS)
+    return kernel
+
+WEAK_TOPIC_KERNEL = _weak_topic_kernel(len(TOPICS) >= JIT_MIN_TOPICS)
 
 def weakest_topics(stats, threshold=WEAK_THRESHOLD, k=WEAK_MAX_TOPICS):
-    acc = compute_accuracies(stats)
-    weak = [(t, acc[t]) for t in TOPICS if acc[t] < threshold]
-    weak.sort(key=lambda x: x[1])
-    return [t for t, _ in weak[:k]]
+    key = (stats["version"], threshold, k)
+    if st.session_state.get("_weak_key") != key:
+        idx = WEAK_TOPIC_KERNEL(compute_accuracies(stats), threshold, k)
+        st.session_state._weak = [TOPICS[i] for i in idx]
+        st.session_state._weak_key = key
+    return st.session_state._weak
+
+def topic_accuracy_lines(stats):
+    """
+    Learning Hub markdown lines, one per topic, memoized per stats version.
+    """
+    version = stats["version"]
+    if st.session_state.get("_lines_version") != version:
+        acc = compute_accuracies(stats)
+        lines = []
+        for i, t in enumerate(TOPICS):
+            total = stats["topic_total"][i]
+            correct = stats["topic_correct"][i]
+            if total > 0:
+                lines.append(f"- **{t}**: {correct}/{total} ({acc[i]*100:.1f}%)")
+            else:
+                lines.append(f"- **{t}**: no attempts yet")
+        st.session_state._lines = lines
+        st.session_state._lines_version = version
+    return st.session_state._lines
+
+def _sample_from_pools(rng: random.Random, pools: list, k: int, out: list, start: int = 0):
+    """
+    Write k distinct entries from the concatenation of the index lists in pools
+    into out[start:start + k], without building it. Positions come from Robert
+    Floyd's algorithm: k draws and a k-sized set, whatever the pool size.
+    """
+    total = sum(map(len, pools))
+    positions = set()
+    for j in range(total - k, total):
+        t = rng.randrange(j + 1)
+        positions.add(j if t in positions else t)
+
+    offset = 0
+    it = iter(sorted(positions))
+    pos = next(it, None)
+    for pool in pools:
+        while pos is not None and pos < offset + len(pool):
+            out[start] = pool[pos - offset]
+            start += 1
+            pos = next(it, None)
+        offset += len(pool)
 
 def personalized_questions(n: int):
     """
-    Daily practice:
+    Daily practice, as indices into ALL_QUESTIONS:
       ~70% from weakest topics (up to 2–3 topics)
       ~30% from other topics for variety
     """
-    stats = st.session_state.global_stats
+    stats = _stats_store(TOPICS)
+    rng = st.session_state.rng
+    n = min(n, N_Q)
 
-    if sum(stats["topic_total"].values()) == 0:
-        return random.sample(ALL_QUESTIONS, k=min(n, len(ALL_QUESTIONS)))
+    if stats["total"] == 0:
+        return rng.sample(range(N_Q), k=n)
 
     weak = weakest_topics(stats, threshold=WEAK_THRESHOLD, k=WEAK_MAX_TOPICS)
     if not weak:
-        return random.sample(ALL_QUESTIONS, k=min(n, len(ALL_QUESTIONS)))
-
-    weak_q = [q for q in ALL_QUESTIONS if q["topic"] in weak]
-    other_q = [q for q in ALL_QUESTIONS if q["topic"] not in weak]
-
-    n = min(n, len(ALL_QUESTIONS))
-    n_weak_target = max(1, int(round(0.7 * n)))
-
-    selected = random.sample(weak_q, k=min(n_weak_target, len(weak_q)))
-    remaining = n - len(selected)
-
-    if remaining > 0:
-        pool = other_q if other_q else ALL_QUESTIONS
-        pool = [q for q in pool if q not in selected]
-        if pool:
-            selected += random.sample(pool, k=min(remaining, len(pool)))
-
-    if len(selected) < n:
-        pool = [q for q in ALL_QUESTIONS if q not in selected]
-        if pool:
-            selected += random.sample(pool, k=min(n - len(selected), len(pool)))
+        return rng.sample(range(N_Q), k=n)
+
+    weak_set = frozenset(weak)
+    weak_pools, other_pools = [], []
+    for t, idx in INDEX_BY_TOPIC.items():
+        (weak_pools if t in weak_set else other_pools).append(idx)
+
+    n_weak = sum(map(len, weak_pools))
+    n_other = N_Q - n_weak
+    if not n_other:
+        return rng.sample(range(N_Q), k=n)
+
+    # Successive weighted draws without replacement: every weak question carries
+    # 0.7/n_weak of the mass and every other question 0.3/n_other. Weights are
+    # constant within each group, so only the per-group counts need simulating.
+    w_weak, w_other = 0.7 / n_weak, 0.3 / n_other
+    left_weak, left_other = n_weak, n_other
+    for _ in range(n):
+        mass_weak = left_weak * w_weak
+        if rng.random() * (mass_weak + left_other * w_other) < mass_weak:
+            left_weak -= 1
+        else:
+            left_other -= 1
 
-    random.shuffle(selected)
-    return selected
+    # The two draws fill one preallocated list: n_weak - left_weak slots, then the rest
+    chosen = [None] * n
+    k_weak = n_weak - left_weak
+    _sample_from_pools(rng, weak_pools, k_weak, chosen)
+    _sample_from_pools(rng, other_pools, n - k_weak, chosen, k_weak)
+    rng.shuffle(chosen)
+    return chosen
 
 # -----------------------
 # DIAGNOSTIC EXAM BUILDER
 # -----------------------
+def _reservoir_sample(rng: random.Random, iterable, k: int):
+    """
+    k items drawn uniformly from an iterable in one pass, without materializing it.
+    Li's Algorithm L: geometric skips instead of one random draw per item.
+    """
+    it = iter(iterable)
+    reservoir = list(islice(it, k))
+    if len(reservoir) < k or k == 0:
+        return reservoir
+
+    w = math.exp(math.log(rng.random()) / k)
+    while True:
+        skip = math.floor(math.log(rng.random()) / math.log(1 - w))
+        item = next(islice(it, skip, None), None)
+        if item is None:
+            return reservoir
+        reservoir[rng.randrange(k)] = item
+        w *= math.exp(math.log(rng.random()) / k)
+
+def _next_from_bucket(rng: random.Random, key: tuple, bucket: tuple):
+    """
+    Deal the next question from a per-session shuffled copy of a bucket.
+    The deck is reshuffled once used up, so restarting the diagnostic doesn't
+    repeat a question from that bucket until all of them have been served.
+    """
+    decks = st.session_state.exam_decks
+    deck = decks.get(key)
+    if not deck:
+        deck = list(bucket)
+        rng.shuffle(deck)
+        decks[key] = deck
+    return deck.pop()
+
 def build_diagnostic_exam():
     """
-    Exactly 3 questions per topic:
+    Exactly 3 questions per topic, as indices into ALL_QUESTIONS:
       1 easy + 1 medium + 1 hard
     If a topic is missing a difficulty bucket, it will fall back to any difficulty in that topic.
     """
-    exam = []
-
-    for topic in TOPICS:
-        picked = []
-
-        for d in DIFFICULTIES:
-            candidates = BY_TOPIC_DIFFICULTY[topic].get(d, [])
-            if candidates:
-                picked.append(random.choice(candidates))
-
-        topic_all = []
-        for d in DIFFICULTIES:
-            topic_all.extend(BY_TOPIC_DIFFICULTY[topic].get(d, []))
-
-        while len(picked) < 3 and topic_all:
-            candidate = random.choice(topic_all)
-            if candidate not in picked:
-                picked.append(candidate)
-
-        exam.extend(picked[:3])
-
-    random.shuffle(exam)
+    rng = st.session_state.rng
+    # Decks hold indices into ALL_QUESTIONS, so start over once the banks change
+    if st.session_state.get("exam_decks_bank") != BANK_VERSION:
+        st.session_state.exam_decks = {}
+        st.session_state.exam_decks_bank = BANK_VERSION
+    # At most 3 per topic; topics with fewer questions leave a tail that is sliced off
+    exam = [None] * (3 * len(TOPICS))
+    filled = 0
+
+    for tid, topic in enumerate(TOPICS):
+        if tid not in TOPICS_NEEDING_FALLBACK:
+            for did in range(len(DIFFICULTIES)):
+                exam[filled] = _next_from_bucket(rng, (tid, did), BUCKETS[tid, did])
+                filled += 1
+            continue
+
+        picked = [
+            _next_from_bucket(rng, (tid, did), BUCKETS[tid, did])
+            for did in range(len(DIFFICULTIES))
+            if (tid, did) in BUCKETS
+        ]
+
+        pool = INDEX_BY_TOPIC[topic]
+        missing = min(3, len(pool)) - len(picked)
+        if missing > 0:
+            picked_ids = set(picked)
+            picked += _reservoir_sample(rng, (i for i in pool if i not in picked_ids), missing)
+
+        exam[filled:filled + len(picked)] = picked
+        filled += len(picked)
+
+    del exam[filled:]
+    rng.shuffle(exam)
     return exam
 
 # -----------------------
@@ -229,10 +580,10 @@ def render_feedback(feedback):
 
 def shuffled_options(q: dict):
     """
-    Deterministically shuffle options based on question id so Streamlit reruns
-    don't change the option order mid-question.
+    Option indices, deterministically shuffled based on question id so Streamlit
+    reruns don't change the option order mid-question.
     """
-    opts = list(q["options"])
+    opts = list(range(len(q["options"])))
     rnd = random.Random(q["id"])
     rnd.shuffle(opts)
     return opts
@@ -240,9 +591,12 @@ def shuffled_options(q: dict):
 def start_exam_session(kind: str, questions: list):
     """
     kind: "diagnostic" or "practice"
+    questions: indices into ALL_QUESTIONS, which keeps session state small
     """
     st.session_state[kind] = {
+        "bank": BANK_VERSION,  # the indices are only valid for this load of the banks
         "questions": questions,
+        "n": len(questions),
         "i": 0,
         "score": 0,
         "done": False,
@@ -250,95 +604,120 @@ def start_exam_session(kind: str, questions: list):
         "last_feedback": None,  # ("success"/"error", message)
     }
 
-def show_question_flow(session_key: str, title_prefix: str):
+def current_session(session_key: str):
+    """
+    The session under session_key, or None if there is none. A session started
+    on banks that have since been reloaded changed is discarded, since its
+    indices no longer point at the questions it was built from.
+    """
+    sess = st.session_state.get(session_key)
+    if sess is not None and sess["bank"] != BANK_VERSION:
+        del st.session_state[session_key]
+        return None
+    return sess
+
+def submit_answer(session_key: str, choice_key: str):
+    """
+    Submit button callback: grade the current question and store feedback.
+    Runs before the rerun Streamlit already does for the click.
+    """
+    sess = current_session(session_key)
+    if sess is None:
+        return
+    q = ALL_QUESTIONS[sess["questions"][sess["i"]]]
+
+    correct = (st.session_state[choice_key] == q["answer_idx"])
+    record_answer(q["_tid"], correct)
+
+    if correct:
+        sess["score"] += 1
+        sess["last_feedback"] = ("success", f"✅ Correct!\n\n**Explanation:** {q['explanation']}")
+    else:
+        sess["last_feedback"] = ("error", f"❌ Incorrect.\n\n**Correct answer:** {q['answer']}\n\n**Explanation:** {q['explanation']}")
+
+    sess["answered"] = True
+
+def next_question(session_key: str):
+    """
+    Next button callback: advance to the following question.
+    """
+    sess = st.session_state[session_key]
+    sess["i"] += 1
+    sess["answered"] = False
+    sess["last_feedback"] = None
+
+    if sess["i"] >= sess["n"]:
+        sess["done"] = True
+
+@st.fragment
+def show_question_flow(session_key: str, title_prefix: str, done_hint: str = ""):
     """
     Two-step flow:
       Submit -> show feedback
       Next -> advance
+    Runs as a fragment, so Submit/Next only rerun this block, not the page.
+    done_hint is shown under the final score since the page around the
+    fragment isn't redrawn when the session finishes.
     """
-    sess = st.session_state[session_key]
+    sess = current_session(session_key)
+    if sess is None:
+        st.warning("The question bank changed since this session started. Please start a new one.")
+        return
+    n = sess["n"]
 
     if sess["done"]:
-        st.success(f"{title_prefix} complete! Score: {sess['score']} / {len(sess['questions'])}")
+        st.success(f"{title_prefix} complete! Score: {sess['score']} / {n}")
+        if done_hint:
+            st.info(done_hint)
         return
 
-    q = sess["questions"][sess["i"]]
+    q = ALL_QUESTIONS[sess["questions"][sess["i"]]]
 
     # progress
-    st.progress(sess["i"] / max(1, len(sess["questions"])))
+    st.progress(sess["i"] / n if n else 0)
 
     st.write(f"**Topic:** {q['topic']} • **Difficulty:** {q['difficulty'].title()}")
     st.subheader(f"Q{sess['i'] + 1}. {q['question']}")
 
     display_opts = shuffled_options(q)
-    choice = st.radio(
+    choice_key = f"{session_key}_choice_{sess['i']}"
+    st.radio(
         "Choose an answer:",
         display_opts,
-        key=f"{session_key}_choice_{sess['i']}",
+        format_func=lambda i: q["options"][i],
+        key=choice_key,
         disabled=sess["answered"]
     )
 
     render_feedback(sess.get("last_feedback"))
 
     if not sess["answered"]:
-        if st.button("Submit Answer"):
-            correct = (choice == q["answer"])
-            record_answer(q["topic"], correct)
-
-            if correct:
-                sess["score"] += 1
-                sess["last_feedback"] = ("success", f"✅ Correct!\n\n**Explanation:** {q['explanation']}")
-            else:
-                sess["last_feedback"] = ("error", f"❌ Incorrect.\n\n**Correct answer:** {q['answer']}\n\n**Explanation:** {q['explanation']}")
-
-            sess["answered"] = True
-            st.rerun()
+        st.button("Submit Answer", on_click=submit_answer, args=(session_key, choice_key))
     else:
-        if st.button("Next Question ➡️"):
-            sess["i"] += 1
-            sess["answered"] = False
-            sess["last_feedback"] = None
-
-            if sess["i"] >= len(sess["questions"]):
-                sess["done"] = True
-
-            st.rerun()
+        st.button("Next Question ➡️", on_click=next_question, args=(session_key,))
 
 # -----------------------
 # SESSION STATE INIT
 # -----------------------
-if "global_stats" not in st.session_state:
-    st.session_state.global_stats = init_global_stats()
-
-# -----------------------
-# SIDEBAR NAV
-# -----------------------
-st.sidebar.header("Navigation")
-page = st.sidebar.radio("Go to:", ["Diagnostic Exam", "Learning Hub", "Daily Practice"])
-
-st.sidebar.markdown("---")
-if st.sidebar.button("🧹 Reset all progress"):
-    st.session_state.global_stats = init_global_stats()
-    st.session_state.pop("diagnostic", None)
-    st.session_state.pop("practice", None)
-    st.sidebar.success("Progress reset.")
-    st.rerun()
+# Per-session RNG for question selection
+if "rng" not in st.session_state:
+    st.session_state.rng = random.Random()
 
 # -----------------------
 # PAGE: DIAGNOSTIC EXAM
 # -----------------------
-if page == "Diagnostic Exam":
+def render_diagnostic_exam():
     st.header("🧪 Diagnostic Exam")
     st.write("Includes **1 easy + 1 medium + 1 hard** question per topic.")
 
     with st.expander("Show bank coverage (counts per topic/difficulty)"):
-        for topic in TOPICS:
+        for tid, topic in enumerate(TOPICS):
             st.write(
                 f"**{topic}** — "
-                + ", ".join(f"{d}: {len(BY_TOPIC_DIFFICULTY[topic].get(d, []))}" for d in DIFFICULTIES)
+                + ", ".join(f"{d}: {len(BUCKETS.get((tid, did), ()))}" for did, d in enumerate(DIFFICULTIES))
             )
 
-    if "diagnostic" not in st.session_state:
+    if current_session("diagnostic") is None:
         if st.button("Start Diagnostic Exam"):
             start_exam_session("diagnostic", build_diagnostic_exam())
             st.rerun()
@@ -351,31 +730,26 @@ if page == "Diagnostic Exam":
         with col2:
             st.caption("Flow: Submit → Next Question")
 
-        show_question_flow("diagnostic", "Diagnostic Exam")
-
-        if st.session_state["diagnostic"]["done"]:
-            st.info("Next: visit **Learning Hub** to see your weakest topics and start improving.")
+        show_question_flow(
+            "diagnostic",
+            "Diagnostic Exam",
+            done_hint="Next: visit **Learning Hub** to see your weakest topics and start improving.",
+        )
 
 # -----------------------
 # PAGE: LEARNING HUB
 # -----------------------
-elif page == "Learning Hub":
+def render_learning_hub():
     st.header("📚 Learning Hub")
 
-    stats = st.session_state.global_stats
-    acc = compute_accuracies(stats)
+    stats = _stats_store(TOPICS)
 
-    if sum(stats["topic_total"].values()) == 0:
+    if stats["total"] == 0:
         st.info("Take the **Diagnostic Exam** first so I can estimate your strengths and weaknesses.")
     else:
         st.subheader("Your topic accuracy so far")
-        for t in TOPICS:
-            total = stats["topic_total"][t]
-            correct = stats["topic_correct"][t]
-            if total > 0:
-                st.write(f"- **{t}**: {correct}/{total} ({acc[t]*100:.1f}%)")
-            else:
-                st.write(f"- **{t}**: no attempts yet")
+        for line in topic_accuracy_lines(stats):
+            st.write(line)
 
         weak = weakest_topics(stats, threshold=WEAK_THRESHOLD, k=WEAK_MAX_TOPICS)
         st.markdown("---")
@@ -397,11 +771,11 @@ elif page == "Learning Hub":
 # -----------------------
 # PAGE: DAILY PRACTICE
 # -----------------------
-elif page == "Daily Practice":
+def render_daily_practice():
     st.header("📆 Daily Practice (Personalized)")
 
-    stats = st.session_state.global_stats
-    if sum(stats["topic_total"].values()) == 0:
+    stats = _stats_store(TOPICS)
+    if stats["total"] == 0:
         st.info("Take the **Diagnostic Exam** first so I can personalize your daily practice.")
     else:
         weak = weakest_topics(stats, threshold=WEAK_THRESHOLD, k=WEAK_MAX_TOPICS)
@@ -414,7 +788,7 @@ elif page == "Daily Practice":
 
         n = st.slider("Number of practice questions:", 3, 15, DEFAULT_DAILY_PRACTICE_N)
 
-        if "practice" not in st.session_state:
+        if current_session("practice") is None:
             if st.button("Start Practice"):
                 start_exam_session("practice", personalized_questions(n))
                 st.rerun()
@@ -429,6 +803,27 @@ elif page == "Daily Practice":
 
             show_question_flow("practice", "Daily Practice")
 
+# -----------------------
+# PAGE DISPATCH
+# -----------------------
+PAGES = {
+    "Diagnostic Exam": render_diagnostic_exam,
+    "Learning Hub": render_learning_hub,
+    "Daily Practice": render_daily_practice,
+}
 
+# -----------------------
+# SIDEBAR NAV
+# -----------------------
+st.sidebar.header("Navigation")
+page = st.sidebar.radio("Go to:", list(PAGES))
 
+st.sidebar.markdown("---")
+if st.sidebar.button("🧹 Reset all progress"):
+    init_global_stats()
+    st.session_state.pop("diagnostic", None)
+    st.session_state.pop("practice", None)
+    st.sidebar.success("Progress reset.")
+    st.rerun()
 
+PAGES[page]()